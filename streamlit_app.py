@@ -1,6 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import hashlib
 import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+# Aho-Corasick backends: ahocorasick-rs is preferred, pyahocorasick's C
+# automaton is used when only that one is installed.
+try:
+    import ahocorasick_rs
+except ImportError:
+    ahocorasick_rs = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # Set page config
 st.set_page_config(
@@ -25,32 +45,205 @@ DEFAULT_DICTIONARIES = {
     }
 }
 
-def detect_tactics(text, dictionaries):
-    """Detect marketing tactics in text and return results."""
-    if pd.isna(text) or not isinstance(text, str):
-        return {'urgency_marketing': 0, 'exclusive_marketing': 0, 'matched_terms': []}
+# Result column for each dictionary, stored as 0/1 uint8 flags (1 byte per row)
+DETECTION_COLUMNS = {
+    'urgency_marketing': 'urgency_detected',
+    'exclusive_marketing': 'exclusive_detected'
+}
+
+# Dictionaries up to this many terms are scanned with one regex per tactic;
+# larger ones go through the Aho-Corasick automaton.
+REGEX_MAX_TERMS = 200
+
+# Minimum rows per thread when the automaton scan is split across cores
+PARALLEL_CHUNK_ROWS = 5000
+
+def parse_terms(text):
+    """Split a text area into normalized terms, one per non-blank line."""
+    # Each line is stripped and lowercased once; blank lines normalize to ''
+    terms = frozenset(line.strip().lower() for line in text.split('\n'))
+    return terms - {''}
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_dictionaries(urgency_text, exclusive_text):
+    """Parse the sidebar text areas into term sets, cached per text content."""
+    # Read-only mapping of frozensets because the cached object is shared
+    # between reruns and sessions
+    return MappingProxyType({
+        'urgency_marketing': parse_terms(urgency_text),
+        'exclusive_marketing': parse_terms(exclusive_text)
+    })
+
+def dictionary_key(dictionaries):
+    """Return a hashable cache key that changes whenever any term is edited."""
+    # Sorted because Streamlit hashes a tuple of frozensets in iteration order,
+    # and two equal sets can iterate differently, giving the same terms two keys.
+    return tuple((tactic, tuple(sorted(terms))) for tactic, terms in dictionaries.items())
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_automaton(dict_tuple):
+    """Build one Aho-Corasick automaton over the terms of every dictionary."""
+    # A term may belong to several dictionaries, so each pattern maps to a
+    # bitmask with one bit per tactic.
+    term_masks = {}
+    for bit, (tactic, terms) in enumerate(dict_tuple):
+        for term in terms:
+            term_masks[term] = term_masks.get(term, 0) | (1 << bit)
    
-    text_lower = text.lower()
-    results = {'urgency_marketing': 0, 'exclusive_marketing': 0, 'matched_terms': []}
+    all_terms = list(term_masks)
+    if ahocorasick_rs is not None:
+        ac = ahocorasick_rs.AhoCorasick(all_terms, matchkind=ahocorasick_rs.MATCHKIND_STANDARD)
+    elif ahocorasick is not None:
+        ac = ahocorasick.Automaton()
+        for pattern, term in enumerate(all_terms):
+            ac.add_word(term, pattern)
+        ac.make_automaton()
+    else:
+        # No automaton: scans fall back to plain substring tests
+        ac = None
+    term_to_category = np.array([term_masks[term] for term in all_terms], dtype=np.uint8)
+    return ac, all_terms, term_to_category
+
+def trie_to_regex(trie):
+    """Emit a regex for the terms in a character trie, sharing common prefixes.
    
-    for tactic, terms in dictionaries.items():
+    Terms end at the '' key; returns None for a node that only ends a term.
+    """
+    if '' in trie and len(trie) == 1:
+        return None
+   
+    branches, chars = [], []
+    for char, child in sorted((c, t) for c, t in trie.items() if c):
+        rest = trie_to_regex(child)
+        if rest is None:
+            chars.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + rest)
+   
+    only_chars = not branches
+    if chars:
+        branches.append(chars[0] if len(chars) == 1 else '[' + ''.join(chars) + ']')
+   
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in trie:
+        # A shorter term ends here, so everything after it is optional
+        pattern = pattern + '?' if only_chars else '(?:' + pattern + ')?'
+    return pattern
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_patterns(dict_tuple):
+    """Build one prefix-factored regex per dictionary.
+   
+    Terms sharing a prefix, such as "limited", "limited time" and
+    "limited edition", become a single "limited(?: time| edition)?" branch
+    instead of separate alternatives that each rescan the prefix.
+    """
+    patterns = {}
+    for tactic, terms in dict_tuple:
+        if not terms:
+            continue
+        trie = {}
         for term in terms:
-            if term in text_lower:
-                results[tactic] = 1
-                results['matched_terms'].append(term)
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        patterns[tactic] = trie_to_regex(trie)
+    return patterns
+
+def lowercase_texts(texts):
+    """Lowercase a text column in one vectorized pass; non-strings become missing."""
+    if texts.dtype != object and pd.api.types.is_string_dtype(texts.dtype):
+        return texts.str.lower()
+   
+    # One type check per cell into a NumPy mask, so the matchers only ever
+    # see strings or missing values
+    values = texts.to_numpy(dtype=object)
+    is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    return pd.Series(np.where(is_text, values, None), index=texts.index, dtype=object).str.lower()
+
+def find_patterns(text, automaton):
+    """Return the pattern index of every dictionary match in text."""
+    ac, all_terms, _ = automaton
+    if not all_terms:
+        return []
+   
+    # Overlapping matches keep substring semantics, e.g. "limited access"
+    # still counts as both "limited" and "limited access".
+    if ac is None:
+        return [pattern for pattern, term in enumerate(all_terms) if term in text]
+    if ahocorasick_rs is not None:
+        return [pattern for pattern, _, _ in ac.find_matches_as_indexes(text, overlapping=True)]
+    return [pattern for _, pattern in ac.iter(text)]
+
+def detect_terms(text, automaton):
+    """Return every distinct dictionary term found in already lowercased text."""
+    all_terms = automaton[1]
+    return [all_terms[pattern] for pattern in dict.fromkeys(find_patterns(text, automaton))]
+
+def scan_chunk(texts, automaton):
+    """Scan a chunk of lowercased texts with the automaton.
    
-    return results
+    Results come back column-wise: a uint8 tactic bitmask per text and a
+    list holding each text's comma-separated matched terms.
+    """
+    _, all_terms, term_to_category = automaton
+    masks = np.zeros(len(texts), dtype=np.uint8)
+    matched_terms = [''] * len(texts)
+   
+    for row, text in enumerate(texts):
+        patterns = find_patterns(text, automaton)
+        if patterns:
+            masks[row] = np.bitwise_or.reduce(term_to_category[patterns])
+            matched_terms[row] = ', '.join(all_terms[pattern] for pattern in dict.fromkeys(patterns))
+   
+    return masks, matched_terms
+
+def scan_automaton(lower, automaton):
+    """Scan a lowercased column with the automaton, in parallel for large inputs."""
+    texts = lower.to_numpy(dtype=object)
+    n_chunks = min(os.cpu_count() or 1, len(texts) // PARALLEL_CHUNK_ROWS)
+   
+    # Only ahocorasick-rs releases the GIL while matching, so threads would
+    # just contend on pyahocorasick or the substring fallback.
+    if ahocorasick_rs is None or n_chunks < 2:
+        return scan_chunk(texts, automaton)
+   
+    with ThreadPoolExecutor(max_workers=n_chunks) as executor:
+        chunks = list(executor.map(
+            lambda chunk: scan_chunk(chunk, automaton),
+            np.array_split(texts, n_chunks)
+        ))
+    masks = np.concatenate([chunk_masks for chunk_masks, _ in chunks])
+    matched_terms = [terms for _, chunk_terms in chunks for terms in chunk_terms]
+    return masks, matched_terms
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def parse_csv(file_hash, _file_bytes):
+    """Parse uploaded CSV bytes with the pyarrow reader, cached per file hash."""
+    # Read only the header to decide the separator instead of parsing twice
+    header = pd.read_csv(io.BytesIO(_file_bytes), nrows=0)
+    sep = ';' if len(header.columns) == 1 and ';' in header.columns[0] else ','
+    if sep == ';':
+        header = pd.read_csv(io.BytesIO(_file_bytes), sep=sep, nrows=0)
+   
+    try:
+        df = pd.read_csv(io.BytesIO(_file_bytes), sep=sep, engine="pyarrow", dtype_backend="pyarrow")
+    except (pd.errors.ParserError, pa.ArrowInvalid):
+        # The pyarrow reader rejects some files the C parser accepts, such as
+        # rows with extra fields, so fall back to the C parser for those
+        return pd.read_csv(io.BytesIO(_file_bytes), sep=sep, dtype_backend="pyarrow")
+   
+    # pyarrow keeps duplicate and blank headers as they are; use the C parser's
+    # names ("Statement.1", "Unnamed: 0") so each column can be selected
+    if not df.columns.equals(header.columns):
+        df.columns = header.columns
+    return df
 
-def load_csv_file(uploaded_file):
+def load_csv_file(uploaded_file, file_hash):
     """Load CSV file with robust parsing."""
     try:
-        # Try comma separator first
-        df = pd.read_csv(uploaded_file)
-        uploaded_file.seek(0)  # Reset file pointer
-       
-        # Check if semicolon-separated
-        if len(df.columns) == 1 and ';' in df.columns[0]:
-            df = pd.read_csv(uploaded_file, sep=';')
+        df = parse_csv(file_hash, uploaded_file.getvalue())
            
     except Exception as e:
         st.error(f"Error reading CSV file: {e}")
@@ -58,18 +251,68 @@ def load_csv_file(uploaded_file):
    
     return df
 
+def match_tactics(lower, dictionaries):
+    """Match a lowercased column against the dictionaries.
+   
+    Returns a (rows, dictionaries) uint8 flag matrix, with columns in
+    dictionary order, and one comma-separated matched-terms string per row.
+    The column must hold only strings; process_data passes the distinct
+    non-missing statements and fans the results back out itself.
+    """
+    dict_tuple = dictionary_key(dictionaries)
+    automaton = build_automaton(dict_tuple)
+    flags = np.zeros((len(lower), len(dictionaries)), dtype=np.uint8)
+   
+    if sum(len(terms) for terms in dictionaries.values()) > REGEX_MAX_TERMS:
+        masks, matched_terms = scan_automaton(lower, automaton)
+        for bit in range(len(dictionaries)):
+            flags[:, bit] = (masks >> bit) & 1
+        return flags, matched_terms
+   
+    # Small dictionaries: scan the whole column with one regex per tactic
+    patterns = build_patterns(dict_tuple)
+    for bit, tactic in enumerate(dictionaries):
+        if tactic in patterns:
+            flags[:, bit] = lower.str.contains(patterns[tactic], regex=True, na=False).to_numpy(dtype=np.uint8)
+   
+    # Only rows with a hit can have matched terms
+    texts = lower.to_numpy(dtype=object)
+    matched_terms = [''] * len(texts)
+    for row in np.flatnonzero(flags.any(axis=1)):
+        matched_terms[row] = ', '.join(detect_terms(texts[row], automaton))
+   
+    return flags, matched_terms
+
 def process_data(df, statement_column, dictionaries):
     """Process dataframe and add marketing tactic detection."""
-    # Apply detection to Statement column
-    detections = df[statement_column].apply(lambda x: detect_tactics(x, dictionaries))
+    lower = lowercase_texts(df[statement_column]).astype('category')
    
-    # Extract results into separate columns
-    df_result = df.copy()
-    df_result['urgency_detected'] = [d['urgency_marketing'] for d in detections]
-    df_result['exclusive_detected'] = [d['exclusive_marketing'] for d in detections]
-    df_result['matched_terms'] = [', '.join(d['matched_terms']) for d in detections]
+    # Match each distinct statement once and fan the results out by code;
+    # missing statements have code -1, which picks the empty row appended last.
+    flags, matched_terms = match_tactics(pd.Series(lower.cat.categories), dictionaries)
+    codes = lower.cat.codes.to_numpy()
+    flags = np.vstack([flags, np.zeros((1, len(dictionaries)), dtype=np.uint8)])[codes]
+    matched_terms = np.array(matched_terms + [''], dtype=object)[codes]
    
-    return df_result
+    # Under copy-on-write (pandas 3) assign binds the new columns onto the
+    # existing ones instead of deep-copying the whole upload first
+    detections = {DETECTION_COLUMNS[tactic]: flags[:, bit] for bit, tactic in enumerate(dictionaries)}
+    return df.assign(**detections, matched_terms=matched_terms)
+
+# Streamlit keys a cached function on its own source and arguments only, so
+# a hash of this file goes into the key to drop results whenever any of the
+# matching helpers above change
+with open(__file__, 'rb') as source:
+    CLASSIFIER_VERSION = hashlib.blake2b(source.read()).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def classify_dataframe(file_hash, _df, statement_column, dict_tuple, classifier_version):
+    """Run process_data once per upload, column, dictionary and code revision.
+   
+    The dataframe itself is left out of the cache key; the blake2b hash of
+    the uploaded bytes identifies it without hashing every row.
+    """
+    return process_data(_df, statement_column, dict(dict_tuple))
 
 def main():
     st.title("🎯 Marketing Tactic Detector")
@@ -99,17 +342,17 @@ def main():
         key="exclusive_terms"
     )
    
-    # Update dictionaries when text changes
-    st.session_state.dictionaries['urgency_marketing'] = set(
-        term.strip().lower() for term in urgency_text.split('\n') if term.strip()
-    )
-    st.session_state.dictionaries['exclusive_marketing'] = set(
-        term.strip().lower() for term in exclusive_text.split('\n') if term.strip()
-    )
+    # Update dictionaries when text changes; reruns from other widgets keep
+    # the parsed dictionaries without touching the cache
+    dict_key = hash((urgency_text, exclusive_text))
+    if st.session_state.get('_dict_key') != dict_key:
+        st.session_state.dictionaries = build_dictionaries(urgency_text, exclusive_text)
+        st.session_state._dict_key = dict_key
    
     # Reset to defaults button
     if st.sidebar.button("Reset to Defaults"):
         st.session_state.dictionaries = DEFAULT_DICTIONARIES.copy()
+        st.session_state.pop('_dict_key', None)
         st.rerun()
    
     # Main content area
@@ -125,7 +368,8 @@ def main():
        
         if uploaded_file is not None:
             # Load and display the data
-            df = load_csv_file(uploaded_file)
+            file_hash = hashlib.blake2b(uploaded_file.getvalue()).hexdigest()
+            df = load_csv_file(uploaded_file, file_hash)
            
             if df is not None:
                 st.success(f"✅ File loaded successfully! Shape: {df.shape}")
@@ -144,7 +388,11 @@ def main():
                 # Process button
                 if st.button("🔍 Analyze Marketing Tactics", type="primary"):
                     with st.spinner("Processing data..."):
-                        result_df = process_data(df, statement_column, st.session_state.dictionaries)
+                        result_df = classify_dataframe(
+                            file_hash, df, statement_column,
+                            dictionary_key(st.session_state.dictionaries),
+                            CLASSIFIER_VERSION
+                        )
                    
                     # Display results
                     st.subheader("📊 Analysis Results")
@@ -159,27 +407,36 @@ def main():
                         st.metric("Exclusive Tactics Detected", result_df['exclusive_detected'].sum())
                    
                     # Show detected tactics
+                    # The flags are 0/1 uint8, so OR them directly rather than
+                    # comparing each column against 1
                     detected_df = result_df[
-                        (result_df['urgency_detected'] == 1) |
-                        (result_df['exclusive_detected'] == 1)
+                        (result_df['urgency_detected'] | result_df['exclusive_detected']).astype(bool)
                     ]
                    
                     if len(detected_df) > 0:
                         st.subheader("🎯 Statements with Marketing Tactics")
                        
-                        # Display with highlighting
-                        for idx, row in detected_df.iterrows():
-                            with st.expander(f"Row {idx + 1}: {row[statement_column][:100]}..."):
-                                st.write(f"**Full Statement:** {row[statement_column]}")
+                        # Display with highlighting; zip over plain arrays avoids
+                        # building a Series per row like iterrows does
+                        rows = zip(
+                            detected_df.index,
+                            detected_df[statement_column].to_numpy(),
+                            detected_df['urgency_detected'].to_numpy(),
+                            detected_df['exclusive_detected'].to_numpy(),
+                            detected_df['matched_terms'].to_numpy()
+                        )
+                        for idx, statement, urgency, exclusive, matched_terms in rows:
+                            with st.expander(f"Row {idx + 1}: {statement[:100]}..."):
+                                st.write(f"**Full Statement:** {statement}")
                                
                                 tactics = []
-                                if row['urgency_detected']:
+                                if urgency:
                                     tactics.append("🚨 Urgency")
-                                if row['exclusive_detected']:
+                                if exclusive:
                                     tactics.append("⭐ Exclusive")
                                
                                 st.write(f"**Tactics Detected:** {', '.join(tactics)}")
-                                st.write(f"**Matched Terms:** {row['matched_terms']}")
+                                st.write(f"**Matched Terms:** {matched_terms}")
                     else:
                         st.info("No marketing tactics detected in the uploaded data.")
                    
@@ -188,8 +445,15 @@ def main():
                     st.dataframe(result_df, use_container_width=True)
                    
                     # Download button
-                    csv_buffer = io.StringIO()
-                    result_df.to_csv(csv_buffer, index=False)
+                    # Arrow writes UTF-8 bytes straight into the buffer, with no
+                    # intermediate Python string. Unlike to_csv, header and string
+                    # fields are always quoted ("needed" still quotes every string
+                    # value) and boolean columns are written as true/false.
+                    csv_buffer = io.BytesIO()
+                    pa_csv.write_csv(
+                        pa.Table.from_pandas(result_df, preserve_index=False), csv_buffer,
+                        pa_csv.WriteOptions(quoting_style="needed")
+                    )
                     csv_data = csv_buffer.getvalue()
                    
                     st.download_button(